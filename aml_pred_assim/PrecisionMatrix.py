@@ -1,82 +1,289 @@
-from sklearn.linear_model import Ridge
-from scipy.sparse import coo_matrix
-import matplotlib.pyplot as plt
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from scipy.sparse import csr_matrix, dia_matrix
+from typing import Tuple, Union
 import numpy as np
+import os
 
 from .utils import save_matrix_to_netcdf
 
 
+# Features handed to a worker thread at a time, to amortize scheduling overhead
+_BATCH_SIZE = 64
+
+# Below this fraction of unexplained variance a single precision Gram block
+# loses too many digits, and the regression is refitted in double precision
+_REFIT_RATIO = 1e-3
+
+# Bound on the double precision temporary used to centre a block of columns
+_CENTRE_BLOCK_BYTES = 16 << 20
+
+
+def _ridge_solve(G: np.ndarray, mean_p: np.ndarray, mean_y: np.ndarray, N: int,
+                 alpha: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Solve a batch of ridge regressions without intercept from centred Gram blocks.
+
+    Args:
+        G: Centred Gram matrices of the predecessors followed by the target, shape (g, k+1, k+1)
+        mean_p: Column means of the predecessors, shape (g, k)
+        mean_y: Means of the targets, shape (g,)
+        N: Number of samples
+        alpha: Ridge regularization parameter
+
+    Returns:
+        coef: Regression coefficients of shape (g, k)
+        var: Variances of the residuals y - X @ coef, shape (g,)
+    """
+    Gpp = G[:, :-1, :-1]
+    Gpy = G[:, :-1, -1]
+    A = Gpp + N * mean_p[:, :, None] * mean_p[:, None, :]
+    diagonal = np.arange(A.shape[1])
+    A[:, diagonal, diagonal] += alpha
+    b = Gpy + N * mean_y[:, None] * mean_p
+    if A.shape[1] == 1:
+        # A single predecessor reduces to a scalar division
+        coef = b / A[:, 0]
+    else:
+        coef = np.linalg.solve(A, b[..., None])[..., 0]
+    explained = np.einsum('gk,gk->g', coef, 2 * Gpy - (Gpp @ coef[..., None])[..., 0])
+    return coef, (G[:, -1, -1] - explained) / N
+
+
+def _dual_ridge_solve(Xp: np.ndarray, y: np.ndarray, mean_p: np.ndarray, mean_y: np.ndarray,
+                      alpha: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Solve a batch of ridge regressions without intercept in their dual (kernel) form.
+
+    With at least as many predecessors as samples, the N x N system (XX^T + alpha I) w = y
+    is smaller than the primal one, and the residual is directly alpha * w, so its
+    variance does not suffer from cancellation.
+
+    Args:
+        Xp: Centred predecessors of shape (g, k, N)
+        y: Centred targets of shape (g, N)
+        mean_p: Column means of the predecessors, shape (g, k)
+        mean_y: Means of the targets, shape (g,)
+        alpha: Ridge regularization parameter
+
+    Returns:
+        coef: Regression coefficients of shape (g, k)
+        var: Variances of the residuals y - X @ coef, shape (g,)
+    """
+    # Kernel of the uncentred predecessors, X = Xp + mean_p
+    shift = np.einsum('gkn,gk->gn', Xp, mean_p)
+    K = Xp.transpose(0, 2, 1) @ Xp + shift[:, :, None] + shift[:, None, :] \
+        + np.einsum('gk,gk->g', mean_p, mean_p)[:, None, None]
+    diagonal = np.arange(K.shape[1])
+    K[:, diagonal, diagonal] += alpha
+    w = np.linalg.solve(K, (y + mean_y[:, None])[..., None])[..., 0]
+    coef = np.einsum('gkn,gn->gk', Xp, w) + mean_p * w.sum(axis=1)[:, None]
+    return coef, np.var(alpha * w, axis=1)
+
+
+def _fit_batch(cols: np.ndarray, XcT: np.ndarray, mean: np.ndarray, N: int, alpha: float,
+               Xb: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Regress a batch of features sharing the same number k of predecessors.
+
+    The Gram blocks are computed in the precision of XcT and solved in double precision.
+    Batches with at least as many predecessors as samples are solved in the dual form,
+    entirely in double precision.
+
+    Args:
+        cols: Predecessor indices of each feature followed by the feature itself, shape (g, k+1)
+        XcT: Centred data matrix of shape (features, samples)
+        mean: Column means of the data matrix
+        N: Number of samples
+        alpha: Ridge regularization parameter
+        Xb: Original data matrix of shape (samples, features), used for refits
+
+    Returns:
+        coef: Regression coefficients of shape (g, k)
+        var: Variances of the residuals, shape (g,)
+    """
+    if cols.shape[1] == 1:
+        # No predecessors: the residual is the centred feature itself
+        y = XcT[cols[:, 0]].astype(np.float64, copy=False)
+        return np.empty((len(cols), 0)), np.einsum('gn,gn->g', y, y) / N
+    Xa = XcT[cols]
+    if cols.shape[1] > N:
+        Xa = Xa.astype(np.float64, copy=False)
+        return _dual_ridge_solve(Xa[:, :-1], Xa[:, -1], mean[cols[:, :-1]], mean[cols[:, -1]], alpha)
+    G = (Xa @ Xa.transpose(0, 2, 1)).astype(np.float64, copy=False)
+    coef, var = _ridge_solve(G, mean[cols[:, :-1]], mean[cols[:, -1]], N, alpha)
+    if XcT.dtype != np.float64:
+        refit = var < _REFIT_RATIO * G[:, -1, -1] / N
+        if refit.any():
+            Xa = np.moveaxis(Xb[:, cols[refit]], 0, -1).astype(np.float64) - mean[cols[refit]][..., None]
+            G = Xa @ Xa.transpose(0, 2, 1)
+            coef[refit], var[refit] = _ridge_solve(G, mean[cols[refit, :-1]], mean[cols[refit, -1]], N, alpha)
+    return coef, var
+
+
 class PrecisionMatrix:
-    def __init__(self, Xb: np.ndarray, pred: list, n: int, alpha: float = 1):
+    def __init__(self, Xb: np.ndarray, pred: Union[list, Tuple[np.ndarray, np.ndarray]], n: int,
+                 alpha: float = 1, n_jobs: int = -1, dtype: type = np.float32):
         """
         Initialize the PrecisionMatrixCalculator with the input data.
 
         Args:
             Xb: Input data matrix of shape (samples, features)
-            pred: Array of predecessor indices for each feature
+            pred: Array of predecessor indices for each feature, or an (indices, indptr)
+                tuple in CSR layout as returned by Predecessor.get_all_predecessors_csr
             n: Number of features/variables
             alpha: Ridge regression regularization parameter (default=1)
+            n_jobs: Number of threads fitting the regressions, -1 for all cores (default=-1)
+            dtype: Precision of the working copy of Xb and of the factors, np.float32 or
+                np.float64 (default=np.float32). Poorly conditioned regressions, and
+                those with at least as many predecessors as samples, are solved in
+                double precision either way.
         """
         if not isinstance(Xb, np.ndarray) or len(Xb.shape) != 2:
             raise ValueError("Xb must be a 2D numpy array")
-        if not isinstance(pred, list):
-            raise TypeError("pred must be a list")
+        if not isinstance(pred, (list, tuple)):
+            raise TypeError("pred must be a list or an (indices, indptr) tuple")
+        if isinstance(pred, tuple) and len(pred) != 2:
+            raise ValueError("pred tuple must hold (indices, indptr)")
         if not isinstance(n, int) or n <= 0:
             raise ValueError("n must be a positive integer")
         if not isinstance(alpha, (int, float)) or alpha <= 0:
             raise ValueError("alpha must be a positive number")
-        if len(pred) != n:
+        if (len(pred[1]) - 1 if isinstance(pred, tuple) else len(pred)) != n:
             raise ValueError("pred length must match n")
+        if not isinstance(n_jobs, int) or n_jobs == 0 or n_jobs < -1:
+            raise ValueError("n_jobs must be a positive integer or -1")
+        if dtype not in (np.float32, np.float64):
+            raise ValueError("dtype must be np.float32 or np.float64")
 
         self.Xb = Xb
         self.pred = pred
+        self.indices, self.indptr = self.__to_csr(pred)
         self.n = n
         self.alpha = alpha
+        self.n_jobs = (os.cpu_count() or 1) if n_jobs == -1 else n_jobs
+        self.dtype = dtype
         self.value = self.__calculate_precision_matrix()
 
 
-    def __calculate_precision_matrix(self) -> Tuple[coo_matrix, coo_matrix]:
+    @staticmethod
+    def __to_csr(pred: Union[list, Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Bring the predecessors to CSR layout.
+
+        Args:
+            pred: List of predecessor arrays or an (indices, indptr) tuple
+
+        Returns:
+            Tuple of (indices, indptr); the predecessors of feature i are
+            indices[indptr[i]:indptr[i + 1]]
+        """
+        if isinstance(pred, tuple):
+            return np.asarray(pred[0]), np.asarray(pred[1])
+        pred = [np.asarray(p, dtype=np.int64).ravel() for p in pred]
+        indptr = np.zeros(len(pred) + 1, dtype=np.int64)
+        np.cumsum([p.size for p in pred], out=indptr[1:])
+        return np.concatenate(pred), indptr
+
+
+    def __calculate_precision_matrix(self) -> Tuple[csr_matrix, dia_matrix]:
         """
         Private method to calculate the precision matrix using Ridge regression.
 
         Returns:
-            T: Sparse matrix (COO format) containing coefficients
-            D: Sparse diagonal matrix (COO format) with precision values
+            T: Sparse matrix (CSR format) containing coefficients
+            D: Sparse diagonal matrix (DIA format) with precision values
         """
         Xb_ = self.Xb
-        lr = Ridge(fit_intercept=False, alpha=self.alpha)
-        T, D, I, J = [], [], [], []
-
-        for i, p in enumerate(self.pred):
-            I.append(i)
-            J.append(i)
-            T.append(1)
-            if i == 0:
-                D.append(1 / np.var(Xb_[:, i]))
-            else:
-                y = Xb_[:, i]
-                X = Xb_[:, p]
-                lr.fit(X, y)
-                residuals = y - lr.predict(X)
-                I.extend([i] * p.size)
-                J.extend(p.tolist())
-                T.extend((-lr.coef_).tolist())
-                D.append(1 / np.var(residuals))
-
-        i = np.array(I, dtype='int32')
-        j = np.array(J, dtype='int32')
-        id = np.arange(self.n)
-        T_matrix = coo_matrix((T, (i, j)))
-        D_matrix = coo_matrix((D, (id, id)))
+        N = Xb_.shape[0]
+        mean = Xb_.mean(axis=0, dtype=np.float64)
+        # Centred copy, feature-major: the Gram block of any predecessor set
+        # is then a single GEMM over contiguous rows. Columns are centred in
+        # double precision a block at a time, so no full float64 copy is made.
+        XcT = np.empty((Xb_.shape[1], N), dtype=self.dtype)
+        block = max(1, _CENTRE_BLOCK_BYTES // (8 * N))
+        for start in range(0, Xb_.shape[1], block):
+            stop = start + block
+            XcT[start:stop] = (Xb_[:, start:stop] - mean[start:stop]).T
+        # The first feature is regressed on nothing.
+        sizes = np.diff(self.indptr)
+        sizes[0] = 0
+        coef, var = self.__fit_all(XcT, mean, N, sizes)
+
+        # Row i holds the unit diagonal followed by its predecessors, so the
+        # offsets are directly the CSR row pointer of T.
+        offsets = np.empty(self.n + 1, dtype=np.int64)
+        offsets[0] = 0
+        np.cumsum(sizes + 1, out=offsets[1:])
+
+        nnz = offsets[-1]
+        diagonal = offsets[:-1]
+        off_diagonal = np.ones(nnz, dtype=bool)
+        off_diagonal[diagonal] = False
+        J = np.empty(nnz, dtype=np.int32)
+        J[diagonal] = np.arange(self.n)
+        J[off_diagonal] = self.indices[self.indptr[1]:]
+        T = np.empty(nnz, dtype=self.dtype)
+        T[diagonal] = 1
+        T[off_diagonal] = -coef
+        D = (1 / var).astype(self.dtype)
+
+        T_matrix = csr_matrix((T, J, offsets), shape=(self.n, self.n))
+        D_matrix = dia_matrix((D[None, :], [0]), shape=(self.n, self.n))
         return T_matrix, D_matrix
 
 
-    def get_decomposition_matrix(self) -> Tuple[coo_matrix, coo_matrix]:
+    def __fit_all(self, XcT: np.ndarray, mean: np.ndarray, N: int, sizes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fit the regressions of all features.
+
+        Features are grouped by their number of predecessors, so each batch of up
+        to _BATCH_SIZE features is solved with stacked Gram products and a single
+        batched LAPACK call. Batches are spread over a thread pool; the work is
+        dominated by BLAS/LAPACK calls, which release the GIL.
+
+        Args:
+            XcT: Centred data matrix of shape (features, samples)
+            mean: Column means of the data matrix
+            N: Number of samples
+            sizes: Number of predecessors regressed on, per feature
+
+        Returns:
+            coef: Coefficients of all features concatenated in feature order
+            var: Residual variance of every feature
+        """
+        indices, indptr = self.indices, self.indptr
+        order = np.argsort(sizes, kind='stable')
+        group_starts = np.flatnonzero(np.diff(sizes[order], prepend=-1))
+        group_stops = np.append(group_starts[1:], self.n)
+        batches = [order[start:min(start + _BATCH_SIZE, stop)]
+                   for group_start, stop in zip(group_starts, group_stops)
+                   for start in range(group_start, stop, _BATCH_SIZE)]
+
+        coef = np.empty(indptr[-1] - indptr[1], dtype=np.float64)
+        var = np.empty(self.n, dtype=np.float64)
+
+        def fit(rows: np.ndarray) -> None:
+            k = sizes[rows[0]]
+            positions = indptr[rows][:, None] + np.arange(k)
+            cols = np.column_stack([indices[positions], rows])
+            coef[positions - indptr[1]], var[rows] = _fit_batch(cols, XcT, mean, N, self.alpha, self.Xb)
+
+        if self.n_jobs == 1 or len(batches) == 1:
+            for rows in batches:
+                fit(rows)
+        else:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                list(executor.map(fit, batches))
+        return coef, var
+
+
+    def get_decomposition_matrix(self) -> Tuple[csr_matrix, dia_matrix]:
         return self.value
 
 
     def show_T(self) -> None:
+        import matplotlib.pyplot as plt
+
         T, _ = self.value
         plt.figure(figsize=(20, 20))
         plt.spy(T, marker='.')
@@ -84,15 +291,17 @@ class PrecisionMatrix:
 
 
     def show_D(self) -> None:
+        import matplotlib.pyplot as plt
+
         _, D = self.value
         plt.figure(figsize=(20, 20))
         plt.spy(D, marker='.')
         plt.show()
 
 
-    def get_matrix(self) -> coo_matrix:
+    def get_matrix(self) -> csr_matrix:
         T, D = self.value
-        Binv = T.T @ T + D
+        Binv = (T.T @ T + D).tocsr()
         return Binv
 
     
@@ -109,7 +318,7 @@ class PrecisionMatrix:
         Store the D matrix in a NetCDF file.
         """
         _, D = self.value
-        save_matrix_to_netcdf(D, filename)
+        save_matrix_to_netcdf(D.tocoo(), filename)
 
 
     def store_matrix(self, filename: str = "Binv.nc") -> None:
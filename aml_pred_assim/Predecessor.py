@@ -1,7 +1,22 @@
-from typing import List, Tuple
+from typing import Tuple
 import numpy as np
 
 
+def _cartesian_product(a: np.ndarray, b: np.ndarray, c: np.ndarray, d: np.ndarray, out: np.ndarray) -> None:
+    """
+    Write the cartesian product of four index arrays into a preallocated buffer.
+
+    Args:
+        a, b, c, d: 1D index arrays, one per coordinate
+        out: Array of shape (4, a.size * b.size * c.size * d.size) with contiguous rows
+    """
+    shape = (a.size, b.size, c.size, d.size)
+    out[0].reshape(shape)[...] = a[:, None, None, None]
+    out[1].reshape(shape)[...] = b[:, None, None]
+    out[2].reshape(shape)[...] = c[:, None]
+    out[3].reshape(shape)[...] = d
+
+
 class Predecessor:
     def __init__(self, matrix: np.ndarray):
         """
@@ -17,6 +32,8 @@ class Predecessor:
         
         self.matrix = matrix
         self.all_predecessors = None
+        self._template_cache = {}
+        self._csr_cache = {}
 
 
     def __validate_point(self, point: Tuple[int, int, int, int]) -> bool:
@@ -31,8 +48,8 @@ class Predecessor:
             bool indicating if point is valid
         """
         i, j, k, l = point
-        shape = self.matrix.shape
-        return all(0 <= idx < dim for idx, dim in zip((i, j, k, l), shape))
+        s0, s1, s2, s3 = self.matrix.shape
+        return 0 <= i < s0 and 0 <= j < s1 and 0 <= k < s2 and 0 <= l < s3
 
 
     def __calculate_bounds(self, shape: Tuple[int, int, int, int], point: Tuple[int, int, int, int], 
@@ -51,35 +68,36 @@ class Predecessor:
             Tuple of (k_min, k_max, l_min, l_max)
         """
         _, _, k, l = point
-        k_min = max(k-r, 0) if y_bound else k-r
-        k_max = min(shape[2], k+r+1) if y_bound else k+r+1
-        l_min = max(l-r, 0) if x_bound else l-r
-        l_max = min(shape[3], l+r+1) if x_bound else l+r+1
+        _, _, s2, s3 = shape
+        if y_bound:
+            k_min, k_max = max(k-r, 0), min(s2, k+r+1)
+        else:
+            k_min, k_max = k-r, k+r+1
+        if x_bound:
+            l_min, l_max = max(l-r, 0), min(s3, l+r+1)
+        else:
+            l_min, l_max = l-r, l+r+1
         return k_min, k_max, l_min, l_max
 
 
-    def __get_indices(self, shape: Tuple[int, int, int, int], k_min: int, k_max: int, 
-                    l_min: int, l_max: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    def __window_offsets(self, size: int, radius: int, bound: bool) -> Tuple[np.ndarray, int]:
         """
-        Get unique indices considering periodic boundaries.
+        Neighborhood offsets along one axis, relative to the point.
 
         Args:
-            shape: Shape of the matrix
-            k_min, k_max: Latitude bounds
-            l_min, l_max: Longitude bounds
-            k: Current latitude point
+            size: Length of the axis
+            radius: Radius for neighborhood calculation
+            bound: Whether to respect the axis boundaries (otherwise the axis is periodic)
 
         Returns:
-            Tuple of (k_indices, l_indices)
+            Tuple of (offsets, preceding), the window offsets and the number of
+            coordinates before the point that are within the radius. On a periodic
+            axis shorter than the window both are limited so that no coordinate
+            is visited twice.
         """
-        
-        k_ind = np.unique(np.arange(k_min, k_max) % shape[2])
-        l_ind = np.unique(np.arange(l_min, l_max) % shape[3])
-
-        if k_ind.size == 0:
-            k_ind = np.array([k])
-        
-        return k_ind, l_ind
+        if bound:
+            return np.arange(-radius, radius + 1), radius
+        return np.arange(-radius, min(radius + 1, size - radius)), min(radius, size - 1)
 
 
     def __calculate_positions(self, i: int, j:int, shape: Tuple[int, int, int, int], k_ind: np.ndarray, 
@@ -95,33 +113,46 @@ class Predecessor:
             l_min, l: Longitude values
 
         Returns:
-            Array of positions
+            Array of shape (4, N) holding the (i, j, k, l) coordinates of each position
         """
-        positions = []
-        positions.append(np.array(np.meshgrid(np.arange(i), np.arange(shape[1]), k_ind, l_ind)).T.reshape(-1, 4))
-        positions.append(np.array(np.meshgrid([i], np.arange(j), k_ind, l_ind)).T.reshape(-1, 4))
-        positions.append(np.array(np.meshgrid([i], [j], k_ind, np.arange(l_min, l))).T.reshape(-1, 4))
-        positions.append(np.array(np.meshgrid([i], [j], np.arange(k_min, k), [l])).T.reshape(-1, 4))
-        return np.concatenate(positions)
+        i_arr, j_arr, l_arr = np.array([i]), np.array([j]), np.array([l])
+        blocks = [
+            (np.arange(i), np.arange(shape[1]), k_ind, l_ind),
+            (i_arr, np.arange(j), k_ind, l_ind),
+            (i_arr, j_arr, k_ind, np.arange(l_min, l)),
+            (i_arr, j_arr, np.arange(k_min, k), l_arr),
+        ]
+        sizes = [a.size * b.size * c.size * d.size for a, b, c, d in blocks]
+        positions = np.empty((4, sum(sizes)), dtype=np.int32)
+        start = 0
+        for block, size in zip(blocks, sizes):
+            _cartesian_product(*block, out=positions[:, start:start + size])
+            start += size
+        return positions
 
 
-    def __flat_indices(self, positions, matrix) -> List:
+    def __flat_indices(self, i: np.ndarray, j: np.ndarray, k: np.ndarray, l: np.ndarray,
+                       matrix: np.ndarray) -> np.ndarray:
         """
         Convert multi-dimensional array positions to flattened indices.
 
+        Points are numbered in the order get_all_predecessors visits them (layer,
+        variable, longitude, latitude), so with bounded axes every predecessor of a
+        point has a lower index. Coordinates outside the matrix wrap around
+        periodically, so on periodic axes predecessors across the boundary can have
+        higher indices. Indices are int32 whenever the matrix is small enough, like
+        get_all_predecessors_csr.
+
         Args:
-            positions: Array of position tuples (i, j, k, l)
+            i, j, k, l: Coordinate arrays of the positions
             matrix: Input matrix to get shape information
 
         Returns:
-            List of flattened indices corresponding to the input positions
+            Array of flattened indices corresponding to the input positions
         """
-        indices = []
-        for pred in positions:
-            i, j, k, l = pred
-            index = l * matrix.shape[1] * matrix.shape[2] * matrix.shape[0] + k * matrix.shape[1] * matrix.shape[0] + j * matrix.shape[0] + i
-            indices.append(index)
-        return indices
+        s0, s1, s2, s3 = matrix.shape
+        flat = np.ravel_multi_index((i, j, l, k), (s0, s1, s3, s2), mode='wrap')
+        return flat.astype(np.int32 if matrix.size < 2**31 else np.int64, copy=False)
 
 
     def get_point_predecessors(self, point: Tuple[int, int, int, int], radius: int, x_bound: bool = True, y_bound: bool = True) -> np.ndarray:
@@ -137,13 +168,65 @@ class Predecessor:
         if not self.__validate_point(point):
             return np.array([])
 
-        lat_min, lat_max, lon_min, lon_max = self.__calculate_bounds(self.matrix.shape, point, radius, x_bound, y_bound)
-        lat_indices, lon_indices = self.__get_indices(self.matrix.shape, lat_min, lat_max, lon_min, lon_max, point[2])
-        positions = self.__calculate_positions(point[0], point[1], self.matrix.shape, lat_indices, lon_indices, lat_min, point[2], lon_min, point[3])
-        return self.__flat_indices(positions, self.matrix)
+        _, _, k, l = point
+        k_min, k_max, l_min, l_max = self.__calculate_bounds(self.matrix.shape, point, radius, x_bound, y_bound)
+        i_pos, j_pos, k_pos, l_pos = self.__template(point[0], point[1], radius, x_bound, y_bound)
+        k_pos, l_pos = k_pos + k, l_pos + l
+        if x_bound or y_bound:
+            inside = (k_pos >= k_min) & (k_pos < k_max) & (l_pos >= l_min) & (l_pos < l_max)
+            i_pos, j_pos, k_pos, l_pos = i_pos[inside], j_pos[inside], k_pos[inside], l_pos[inside]
+        return self.__flat_indices(i_pos, j_pos, k_pos, l_pos, self.matrix)
+
 
+    def __template(self, i: int, j: int, radius: int, x_bound: bool, y_bound: bool) -> np.ndarray:
+        """
+        Predecessor positions of the points of a (layer, variable) pair, ignoring boundaries.
+
+        The latitude and longitude rows hold offsets relative to the point, so a
+        single template serves every point of the pair. Templates are cached.
 
-    def get_all_predecessors(self, radius: int, x_bound: bool = True, y_bound: bool = True) -> np.ndarray:
+        Args:
+            i: Layer of the points
+            j: Variable of the points
+            radius: Radius for neighborhood calculation
+            x_bound: Whether to respect x-axis boundaries
+            y_bound: Whether to respect y-axis boundaries
+
+        Returns:
+            Array of shape (4, N) of relative positions
+        """
+        key = (i, j, radius, x_bound, y_bound)
+        if key not in self._template_cache:
+            shape = self.matrix.shape
+            k_off, k_prev = self.__window_offsets(shape[2], radius, y_bound)
+            l_off, l_prev = self.__window_offsets(shape[3], radius, x_bound)
+            self._template_cache[key] = self.__calculate_positions(i, j, shape, k_off, l_off, -k_prev, 0, -l_prev, 0)
+        return self._template_cache[key]
+
+
+    def __window(self, size: int, radius: int, bound: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Neighborhood window and preceding coordinates of every coordinate along one axis.
+
+        Args:
+            size: Length of the axis
+            radius: Radius for neighborhood calculation
+            bound: Whether to respect the axis boundaries (otherwise the axis is periodic)
+
+        Returns:
+            Tuple of (window, window_mask, preceding, preceding_mask); row c of each
+            array belongs to coordinate c and the masks flag the entries inside the axis
+        """
+        offsets, preceding = self.__window_offsets(size, radius, bound)
+        window = np.arange(size)[:, None] + offsets
+        previous = np.arange(size)[:, None] + np.arange(-preceding, 0)
+        if not bound:
+            return (window % size, np.ones(window.shape, dtype=bool),
+                    previous % size, np.ones(previous.shape, dtype=bool))
+        return window, (window >= 0) & (window < size), previous, previous >= 0
+
+
+    def get_all_predecessors(self, radius: int, x_bound: bool = True, y_bound: bool = True) -> list:
         """
         Get all predecessors for all points in the matrix.
 
@@ -153,17 +236,79 @@ class Predecessor:
             y_bound: Whether to respect y-axis boundaries.
 
         Returns:
-            numpy array of predecessors for all points.
-        """
-        if self.all_predecessors is not None:
-            return self.all_predecessors
-        results = []
-        for layer in range(self.matrix.shape[0]):
-            for variable in range(self.matrix.shape[1]):
-                for longitude in range(self.matrix.shape[3]):
-                    for latitude in range(self.matrix.shape[2]):
-                        point = (layer, variable, latitude, longitude)
-                        predecessors = self.get_point_predecessors(point, radius, x_bound, y_bound)
-                        results.append(np.array(predecessors))
-        self.all_predecessors = results
-        return results
\ No newline at end of file
+            List with the array of predecessors of every point, as views into
+            the arrays returned by get_all_predecessors_csr.
+        """
+        indices, indptr = self.get_all_predecessors_csr(radius, x_bound, y_bound)
+        self.all_predecessors = [indices[start:stop] for start, stop in zip(indptr[:-1], indptr[1:])]
+        return self.all_predecessors
+
+
+    def get_all_predecessors_csr(self, radius: int, x_bound: bool = True,
+                                 y_bound: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get all predecessors for all points in the matrix in CSR layout.
+
+        Points are visited by layer, variable, longitude and latitude. For a fixed
+        (layer, variable) pair the predecessors of every (latitude, longitude) point
+        are built at once by broadcasting the per-axis neighborhood windows.
+
+        Args:
+            radius: Radius for neighborhood calculation.
+            x_bound: Whether to respect x-axis boundaries.
+            y_bound: Whether to respect y-axis boundaries.
+
+        Returns:
+            Tuple of (indices, indptr); the predecessors of point p are
+            indices[indptr[p]:indptr[p + 1]].
+        """
+        if not isinstance(radius, int) or radius <= 0:
+            raise ValueError("Radius must be a positive integer")
+        if not isinstance(x_bound, bool) or not isinstance(y_bound, bool):
+            raise TypeError("x_bound and y_bound must be boolean values")
+        key = (radius, x_bound, y_bound)
+        if key in self._csr_cache:
+            return self._csr_cache[key]
+
+        s0, s1, s2, s3 = self.matrix.shape
+        stride_i, stride_j, stride_l = s1 * s3 * s2, s3 * s2, s2
+        k_win, k_win_mask, k_prev, k_prev_mask = self.__window(s2, radius, y_bound)
+        l_win, l_win_mask, l_prev, l_prev_mask = self.__window(s3, radius, x_bound)
+        l_grid = np.arange(s3)
+
+        # Axes of the broadcasts below: (longitude, latitude, layer/variable, k offset, l offset)
+        window = l_win[:, None, None, None, :] * stride_l + k_win[None, :, None, :, None]
+        window_mask = l_win_mask[:, None, None, None, :] & k_win_mask[None, :, None, :, None]
+        lon_prev = l_prev[:, None, None, :] * stride_l + k_win[None, :, :, None]
+        lon_prev_mask = l_prev_mask[:, None, None, :] & k_win_mask[None, :, :, None]
+        lat_prev = l_grid[:, None, None] * stride_l + k_prev[None, :, :]
+        lat_prev_mask = np.broadcast_to(k_prev_mask[None, :, :], lat_prev.shape)
+
+        chunks, counts = [], []
+        for layer in range(s0):
+            for variable in range(s1):
+                own = layer * stride_i + variable * stride_j
+                # Every (layer, variable) pair before the current one
+                previous = np.arange(own, step=stride_j)
+                blocks = [
+                    (window + previous[None, None, :, None, None]).reshape(s3, s2, -1),
+                    (lon_prev + own).reshape(s3, s2, -1),
+                    lat_prev + own,
+                ]
+                masks = [
+                    np.broadcast_to(window_mask, window.shape[:2] + (previous.size,) + window.shape[3:]).reshape(s3, s2, -1),
+                    lon_prev_mask.reshape(s3, s2, -1),
+                    lat_prev_mask,
+                ]
+                mask = np.concatenate(masks, axis=-1)
+                chunks.append(np.concatenate(blocks, axis=-1)[mask])
+                counts.append(mask.sum(axis=-1).ravel())
+
+        counts = np.concatenate(counts)
+        nnz = int(counts.sum())
+        indptr = np.empty(counts.size + 1, dtype=np.int32 if nnz < 2**31 else np.int64)
+        indptr[0] = 0
+        np.cumsum(counts, out=indptr[1:])
+        indices = np.concatenate(chunks).astype(np.int32 if self.matrix.size < 2**31 else np.int64, copy=False)
+        self._csr_cache[key] = indices, indptr
+        return indices, indptr
@@ -1,12 +1,14 @@
 from datetime import datetime as dt
-from typing import List
+from functools import lru_cache
+from typing import List, Optional, Tuple
 import numpy as np
 import os
 
 from .mapper.cds import ClimateDataStorage
 
 
-def get_climate_data_from_api(variables: List[str], datetime: dt, pressure_levels: List[str], api_key: str) -> np.ndarray:
+def get_climate_data_from_api(variables: List[str], datetime: dt, pressure_levels: List[str], api_key: str,
+                              cache_dir: Optional[str] = None) -> np.ndarray:
     """
     Retrieves climate data using the API.
     
@@ -15,6 +17,7 @@ def get_climate_data_from_api(variables: List[str], datetime: dt, pressure_level
         datetime: Date and time for the data
         pressure_levels: List of pressure levels to consider
         api_key: Authentication key for the API
+        cache_dir: Optional directory caching downloads (no caching by default)
         
     Returns:
         Climate data as numpy array
@@ -45,13 +48,40 @@ def get_climate_data_from_api(variables: List[str], datetime: dt, pressure_level
         hours=datetime.hour,
         pressure_levels=pressure_levels,
         key=api_key,
+        cache_dir=cache_dir,
     )
     return climate_storage.data
 
 
+@lru_cache(maxsize=1)
+def _load_climate_data(file_path: str, mtime_ns: int, variables: Tuple[str, ...]) -> np.ndarray:
+    """
+    Read climate data from a file, memoized on its path, modification time and variables.
+
+    Only the most recent ensemble is kept alive; _load_climate_data.cache_clear()
+    releases it.
+
+    Args:
+        file_path: Absolute path to the data file
+        mtime_ns: Modification time of the file, so a replaced file is read again
+        variables: Climate variables to retrieve
+
+    Returns:
+        Read-only climate data as numpy array
+    """
+    data = ClimateDataStorage(variables=list(variables), path=file_path).data
+    data.flags.writeable = False
+    return data
+
+
 def get_climate_data_from_file(variables: List[str], file_path: str) -> np.ndarray:
     """
     Retrieves climate data from a static file.
+
+    Repeated calls for an unchanged file and the same variables reuse the data read
+    the first time, so the returned array is read-only (writeable=False); copy it
+    before normalising it in place. The last ensemble read stays in memory until
+    another one is read or _load_climate_data.cache_clear() is called.
     
     Args:
         variables: List of climate variables to retrieve
@@ -74,8 +104,5 @@ def get_climate_data_from_file(variables: List[str], file_path: str) -> np.ndarr
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
-    climate_storage = ClimateDataStorage(
-        variables=variables,
-        path=file_path
-    )
-    return climate_storage.data
\ No newline at end of file
+    file_path = os.path.abspath(file_path)
+    return _load_climate_data(file_path, os.stat(file_path).st_mtime_ns, tuple(variables)).view()
\ No newline at end of file
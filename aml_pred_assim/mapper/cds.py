@@ -4,12 +4,45 @@ Climate Data Storage Module.
 This module provides functionality for downloading and processing climate data from the Copernicus Climate Data Store (CDS).
 """
 
-from typing import List, Optional
-import os, cdsapi, json
+from functools import lru_cache
+from typing import Dict, List, Optional
+import os, json, hashlib, tempfile
 import netCDF4 as nc
 import numpy as np
 
 
+# HDF5 chunk cache per variable, large enough to hold every chunk touched by one slab read
+_CHUNK_CACHE_BYTES = 64 * 1024 * 1024
+
+# Ensembles kept in a cache directory, one file per distinct CDS request; the least
+# recently used ones are deleted beyond this count
+_CACHE_MAX_ENTRIES = 4
+
+
+def _evict_cache(cache_dir: str, max_entries: int) -> None:
+    """Delete the least recently used ensembles beyond max_entries.
+
+    Args:
+        cache_dir: Directory holding downloaded ensembles
+        max_entries: Number of ensembles to keep
+    """
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".nc")]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for entry in entries[max_entries:]:
+        os.remove(entry)
+
+
+@lru_cache(maxsize=1)
+def _load_var_map() -> Dict[str, str]:
+    """Load the mapping from variable names to CDS short names, once per process.
+
+    Returns:
+        Dict[str, str]: Short name of every supported variable
+    """
+    with open(os.path.join(os.path.dirname(__file__), "cds_variables.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
 class ClimateDataStorage:
     """A class to handle climate data storage and processing.
     
@@ -36,6 +69,7 @@ class ClimateDataStorage:
             pressure_levels: Optional[List[str]] = None,
             key: Optional[str] = None,
             path: Optional[str] = None,
+            cache_dir: Optional[str] = None,
         ) -> None:
         """Initialize the ClimateDataStorage instance.
         
@@ -48,6 +82,7 @@ class ClimateDataStorage:
             pressure_levels: List of pressure levels to consider
             key: API key for CDS access
             path: Optional path to existing NetCDF file
+            cache_dir: Optional directory caching downloaded ensembles (no caching by default)
             
         Raises:
             ValueError: If required parameters are missing
@@ -63,7 +98,7 @@ class ClimateDataStorage:
             self.hours = hours
             self.pressure_levels = pressure_levels
             
-            self.__download_ensemble(key)
+            path = self.__download_ensemble(key, cache_dir)
         else:
             if not variables:
                 raise ValueError("No variables provided")
@@ -121,23 +156,33 @@ class ClimateDataStorage:
         """
         print("\033[1;33m\nReading hardcoded data...\n\033[0m")
         try:
-            with open(os.path.join(os.path.dirname(__file__), "cds_variables.json"), "r", encoding="utf-8") as f:
-                hardcoded_variables = json.load(f)
+            hardcoded_variables = _load_var_map()
+            missing = [var for var in variables if var not in hardcoded_variables]
+            if missing:
+                raise ValueError(f"Unknown variables: {missing}")
             return [hardcoded_variables[var] for var in variables]
         except Exception as e:
             raise Exception(f"\033[1;31mError reading hardcoded data:\033[0m {e}")
 
 
-    def __download_ensemble(self, key: str) -> None:
+    def __download_ensemble(self, key: str, cache_dir: Optional[str] = None) -> str:
         """Download climate data ensemble from CDS.
+
+        Without cache_dir the ensemble is downloaded to ./ensemble.nc. With it,
+        ensembles are stored in cache_dir keyed on the request, so repeating a
+        request reuses the earlier download. Only the _CACHE_MAX_ENTRIES most
+        recently used ensembles are kept there; deleting the directory clears it.
         
         Args:
             key: API key for CDS access
+            cache_dir: Optional directory caching downloaded ensembles
+            
+        Returns:
+            str: Path to the downloaded NetCDF file
             
         Raises:
             Exception: If error occurs during download
         """
-        print("\033[1;33m\nDownloading ensemble...\n\033[0m")
         try:
             dataset = "reanalysis-era5-pressure-levels"
             request = {
@@ -152,42 +197,66 @@ class ClimateDataStorage:
                 "download_format": "unarchived"
             }
 
+            if cache_dir:
+                request_hash = hashlib.sha1(json.dumps([dataset, request], sort_keys=True).encode()).hexdigest()
+                path = os.path.join(cache_dir, f"{request_hash}.nc")
+                if os.path.exists(path):
+                    # Mark the entry as recently used
+                    os.utime(path)
+                    print("\033[1;33m\nUsing cached ensemble\n\033[0m")
+                    return path
+            else:
+                path = "./ensemble.nc"
+
+            import cdsapi
+
+            print("\033[1;33m\nDownloading ensemble...\n\033[0m")
             client = cdsapi.Client(url="https://cds.climate.copernicus.eu/api", key=key)
-            client.retrieve(dataset, request).download("./ensemble.nc")
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+                fd, download_path = tempfile.mkstemp(suffix=".part", dir=cache_dir)
+                os.close(fd)
+                try:
+                    client.retrieve(dataset, request).download(download_path)
+                    # Publish only complete downloads
+                    os.replace(download_path, path)
+                finally:
+                    if os.path.exists(download_path):
+                        os.remove(download_path)
+                _evict_cache(cache_dir, _CACHE_MAX_ENTRIES)
+            else:
+                client.retrieve(dataset, request).download(path)
             print("\033[1;33m\nDownloaded ensemble\n\033[0m")
+            return path
         except Exception as e:
             raise Exception(f"\033[1;31mError downloading ensemble:\033[0m {e}")            
 
 
-    def get_data(self, path: Optional[str]) -> np.ndarray:
+    def get_data(self, path: str) -> np.ndarray:
         """Process and extract data from NetCDF file.
         
         Args:
-            path: Optional path to existing NetCDF file
+            path: Path to the NetCDF file, given or downloaded
             
         Returns:
-            np.ndarray: Processed climate data array
+            np.ndarray: Processed climate data array in single precision
             
         Raises:
             Exception: If error occurs during data processing
         """
         print("\033[1;33m\nGetting and extracting data...\n\033[0m")
         try:
-            dataset = nc.Dataset(path if path else "./ensemble.nc")
-            pressure_levels = dataset.variables["pressure_level"].shape[0]
-            ensembles = dataset.variables[self.hardcoded_variables[0]].shape[0]
-
-            data_layers = []  # Ensemble | Layer | Variable | Latitude | Longitude
-            for ensemble_index in range(ensembles):
-                ensemble_data = []
-                for i_layer in range(pressure_levels):
-                    layer = []
-                    for variable in self.hardcoded_variables:
-                        level = dataset.variables[variable][ensemble_index, 0, i_layer, :, :].data
-                        layer.append(level)
-                    ensemble_data.append(np.array(layer))
-                data_layers.append(np.array(ensemble_data))
-            
-            return np.array(data_layers)  # Ensemble is now the first dimension
+            with nc.Dataset(path) as dataset:
+                ensembles, _, pressure_levels, latitudes, longitudes = dataset.variables[self.hardcoded_variables[0]].shape
+                # Ensemble | Layer | Variable | Latitude | Longitude
+                data = np.empty((ensembles, pressure_levels, len(self.hardcoded_variables), latitudes, longitudes),
+                                dtype=np.float32)
+                for i_variable, variable in enumerate(self.hardcoded_variables):
+                    values = dataset.variables[variable]
+                    values.set_var_chunk_cache(size=_CHUNK_CACHE_BYTES, nelems=4001, preemption=0.75)
+                    # One slab read per variable, unpacked values are downcast on assignment
+                    data[:, :, i_variable] = np.ma.getdata(values[:, 0])
+
+            return data
         except Exception as e:
             raise Exception(f"\033[1;31mError getting or extracting data:\033[0m {e}")
@@ -4,17 +4,36 @@ from netCDF4 import Dataset
 import numpy as np
 
 
-def save_matrix_to_netcdf(matrix, file_path, variable_name="data") -> None:
+# Bounds on the size of a chunk of a dense matrix; smaller matrices are stored contiguously
+_MIN_CHUNK_BYTES = 1 << 20
+_MAX_CHUNK_BYTES = 16 << 20
+
+# Entries per chunk of the 1D arrays of a sparse matrix
+_SPARSE_CHUNK = 1 << 16
+
+
+def save_matrix_to_netcdf(matrix, file_path, variable_name="data", compress=True, compression="zlib") -> None:
     """
     Save a dense or sparse matrix to a NetCDF (.nc) file.
 
+    CSR matrices are stored as (indptr, indices, data) and COO matrices as
+    (row, col, val) records; the layout is recorded in the sparse_format attribute.
+    COO matrices averaging more than 4 entries per row are stored as CSR, whose row
+    pointers are then smaller than a row index per entry.
+
     Args:
-        matrix (numpy.ndarray or scipy.sparse.coo_matrix): 
-            The matrix to save. Can be a dense numpy array or a sparse COO matrix.
+        matrix (numpy.ndarray, scipy.sparse.coo_matrix or scipy.sparse.csr_matrix): 
+            The matrix to save. Can be a dense numpy array or a sparse COO or CSR matrix.
         file_path (str): 
             The path to the NetCDF file where the matrix will be saved.
         variable_name (str): 
             The base name for the variable(s) to store the data.
+        compress (bool): 
+            Whether to store the variables chunked and compressed.
+        compression (str): 
+            The compressor of a dense matrix: "zlib" (shuffled) or "zstd", which writes
+            faster but needs a netCDF library built with zstd. Sparse matrices always
+            use zlib.
 
     Raises:
         ValueError: If the matrix type is unsupported.
@@ -22,20 +41,93 @@ def save_matrix_to_netcdf(matrix, file_path, variable_name="data") -> None:
     try:
         with Dataset(file_path, "w", format="NETCDF4") as nc_file:
             if isinstance(matrix, np.ndarray):
-                _save_dense_matrix_to_netcdf(matrix, nc_file, variable_name)
+                _save_dense_matrix_to_netcdf(matrix, nc_file, variable_name, compress, compression)
                 print(f"Dense matrix successfully saved to {file_path}")
-            elif isinstance(matrix, coo_matrix) or isinstance(matrix, csr_matrix):
-                if isinstance(matrix, csr_matrix):
-                    matrix = matrix.tocoo()
-                _save_sparse_matrix_to_netcdf(matrix, nc_file, variable_name)
+            elif isinstance(matrix, csr_matrix):
+                _save_csr_matrix_to_netcdf(matrix, nc_file, variable_name, compress)
+                print(f"Sparse matrix successfully saved to {file_path}")
+            elif isinstance(matrix, coo_matrix):
+                if matrix.nnz > 4 * matrix.shape[0]:
+                    _save_csr_matrix_to_netcdf(matrix.tocsr(), nc_file, variable_name, compress)
+                else:
+                    _save_sparse_matrix_to_netcdf(matrix, nc_file, variable_name, compress)
                 print(f"Sparse matrix successfully saved to {file_path}")
             else:
-                raise ValueError("Unsupported matrix type. Provide a numpy array or scipy.sparse.coo_matrix.")
+                raise ValueError("Unsupported matrix type. Provide a numpy array, scipy.sparse.coo_matrix or scipy.sparse.csr_matrix.")
     except Exception as e:
         raise ValueError(f"Error saving the matrix: {e}")
 
 
-def _save_dense_matrix_to_netcdf(matrix, nc_file, variable_name):
+def _compression_options(chunksizes, compress, complevel=4, compression="zlib") -> dict:
+    """
+    Build the createVariable keyword arguments for a compressed, chunked variable.
+
+    Args:
+        chunksizes (tuple): The chunk shape of the variable, empty for contiguous storage.
+        compress (bool): Whether compression is requested.
+        complevel (int): The compression level.
+        compression (str): The netCDF compression name.
+
+    Returns:
+        dict: Keyword arguments for createVariable (empty for no compression).
+    """
+    if not compress or not chunksizes or 0 in chunksizes:
+        return {}
+    options = {"compression": compression, "complevel": complevel, "chunksizes": tuple(chunksizes)}
+    # netCDF4 only applies the shuffle filter together with zlib
+    if compression == "zlib":
+        options["shuffle"] = True
+    return options
+
+
+def _dense_chunksizes(shape, itemsize) -> tuple:
+    """
+    Chunk a dense matrix into blocks of at most 16 MiB, halving the leading
+    dimensions first so chunks stay aligned with whole trailing rows.
+
+    Args:
+        shape (tuple): The shape of the matrix.
+        itemsize (int): The size in bytes of one element.
+
+    Returns:
+        tuple: The chunk shape, empty for 1D or matrices under 1 MiB.
+    """
+    if len(shape) < 2 or 0 in shape or int(np.prod(shape)) * itemsize < _MIN_CHUNK_BYTES:
+        return ()
+    chunks = list(shape)
+    for dim in range(len(chunks)):
+        while chunks[dim] > 1 and int(np.prod(chunks)) * itemsize > _MAX_CHUNK_BYTES:
+            chunks[dim] = -(-chunks[dim] // 2)
+    return tuple(chunks)
+
+
+def _sparse_chunksizes(nnz) -> tuple:
+    """
+    Chunk the 1D arrays of a sparse matrix into _SPARSE_CHUNK entries.
+
+    Args:
+        nnz (int): The number of stored entries.
+
+    Returns:
+        tuple: The chunk shape.
+    """
+    return (min(nnz, _SPARSE_CHUNK),)
+
+
+def _index_dtype(bound) -> np.dtype:
+    """
+    Pick the narrowest stored integer type for indices below a bound.
+
+    Args:
+        bound (int): The exclusive upper bound of the indices.
+
+    Returns:
+        numpy.dtype: int32 when the indices fit, int64 otherwise.
+    """
+    return np.dtype("<i4") if bound < 2**31 else np.dtype("<i8")
+
+
+def _save_dense_matrix_to_netcdf(matrix, nc_file, variable_name, compress=True, compression="zlib"):
     """
     Save a dense matrix to a NetCDF file.
 
@@ -43,36 +135,86 @@ def _save_dense_matrix_to_netcdf(matrix, nc_file, variable_name):
         matrix (numpy.ndarray): The dense matrix to save.
         nc_file (netCDF4.Dataset): The open NetCDF file object.
         variable_name (str): The name of the variable to store the data.
+        compress (bool): Whether to compress the variable.
+        compression (str): The netCDF compression name, "zlib" or "zstd".
     """
     dimensions = {}
     for dim_idx, dim_size in enumerate(matrix.shape):
         dim_name = f"dim_{dim_idx}"
         dimensions[dim_name] = nc_file.createDimension(dim_name, dim_size)
 
-    var = nc_file.createVariable(variable_name, matrix.dtype, tuple(dimensions.keys()))
+    var = nc_file.createVariable(variable_name, matrix.dtype, tuple(dimensions.keys()),
+                                 **_compression_options(_dense_chunksizes(matrix.shape, matrix.dtype.itemsize), compress,
+                                                        complevel=2, compression=compression))
     var[:] = matrix
 
 
-def _save_sparse_matrix_to_netcdf(sparse_matrix, nc_file, variable_name):
+def _save_sparse_matrix_to_netcdf(sparse_matrix, nc_file, variable_name, compress=True):
     """
     Save a sparse COO matrix to a NetCDF file.
 
+    The entries are stored as a single variable of compound type with the fields
+    row, col and val. Indices are stored as int32 whenever the shape allows it; the
+    in-memory index dtypes are kept in the row_dtype and col_dtype attributes.
+
     Args:
         sparse_matrix (coo_matrix): The sparse matrix to save in COO format.
         nc_file (netCDF4.Dataset): The open NetCDF file object.
+        variable_name (str): The name of the variable storing the entries.
+        compress (bool): Whether to compress the variables.
+    """
+    nc_file.createDimension("nnz", sparse_matrix.nnz)
+    nc_file.createDimension("dim_0", sparse_matrix.shape[0])
+    nc_file.createDimension("dim_1", sparse_matrix.shape[1])
+
+    # One compound record per entry, written in a single call
+    record = np.empty(sparse_matrix.nnz, dtype=[("row", _index_dtype(sparse_matrix.shape[0])),
+                                                ("col", _index_dtype(sparse_matrix.shape[1])),
+                                                ("val", sparse_matrix.data.dtype)])
+    record["row"] = sparse_matrix.row
+    record["col"] = sparse_matrix.col
+    record["val"] = sparse_matrix.data
+
+    record_type = nc_file.createCompoundType(record.dtype, f"{variable_name}_t")
+    record_var = nc_file.createVariable(variable_name, record_type, ("nnz",),
+                                        **_compression_options(_sparse_chunksizes(sparse_matrix.nnz), compress))
+    record_var[:] = record
+    record_var.row_dtype = str(sparse_matrix.row.dtype)
+    record_var.col_dtype = str(sparse_matrix.col.dtype)
+
+    nc_file.sparse_format = "coo"
+
+
+def _save_csr_matrix_to_netcdf(sparse_matrix, nc_file, variable_name, compress=True):
+    """
+    Save a sparse CSR matrix to a NetCDF file.
+
+    indptr and indices are stored as int32 whenever nnz and the number of columns
+    allow it; the in-memory dtypes are kept in their original_dtype attributes.
+
+    Args:
+        sparse_matrix (csr_matrix): The sparse matrix to save in CSR format.
+        nc_file (netCDF4.Dataset): The open NetCDF file object.
         variable_name (str): The base name for the variables storing sparse data.
+        compress (bool): Whether to compress the variables.
     """
     nc_file.createDimension("nnz", sparse_matrix.nnz)
+    nc_file.createDimension("n_indptr", sparse_matrix.shape[0] + 1)
     nc_file.createDimension("dim_0", sparse_matrix.shape[0])
     nc_file.createDimension("dim_1", sparse_matrix.shape[1])
 
-    row_var = nc_file.createVariable(f"{variable_name}_row", "i4", ("nnz",))
-    row_var[:] = sparse_matrix.row
+    indptr_var = nc_file.createVariable(f"{variable_name}_indptr", _index_dtype(sparse_matrix.nnz + 1), ("n_indptr",),
+                                        **_compression_options(_sparse_chunksizes(sparse_matrix.shape[0] + 1), compress))
+    indptr_var[:] = sparse_matrix.indptr
+    indptr_var.original_dtype = str(sparse_matrix.indptr.dtype)
 
-    col_var = nc_file.createVariable(f"{variable_name}_col", "i4", ("nnz",))
-    col_var[:] = sparse_matrix.col
+    options = _compression_options(_sparse_chunksizes(sparse_matrix.nnz), compress)
+    indices_var = nc_file.createVariable(f"{variable_name}_indices", _index_dtype(sparse_matrix.shape[1]), ("nnz",),
+                                         **options)
+    indices_var[:] = sparse_matrix.indices
+    indices_var.original_dtype = str(sparse_matrix.indices.dtype)
 
-    data_var = nc_file.createVariable(f"{variable_name}_data", sparse_matrix.data.dtype, ("nnz",))
+    data_var = nc_file.createVariable(f"{variable_name}_data", sparse_matrix.data.dtype, ("nnz",), **options)
     data_var[:] = sparse_matrix.data
 
-    nc_file.sparse_format = "coo"
+    nc_file.sparse_format = "csr"
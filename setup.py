@@ -10,7 +10,6 @@ setup(
     install_requires=[
         'setuptools==75.5.0',
         'wheel==0.45.0',
-        'scikit-learn==1.5.2',
         'numpy==2.1.3',
         'scipy==1.14.1',
         'cdsapi==0.7.4',
@@ -0,0 +1,7 @@
+import tempfile
+import os
+
+
+def make_test_dir() -> tempfile.TemporaryDirectory:
+    """Create a temporary directory for test files, kept in memory when a tmpfs is available."""
+    return tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
@@ -1,20 +1,34 @@
+from unittest import mock
+from netCDF4 import Dataset
 import unittest
 from datetime import datetime
 import numpy as np
+import os
 
+from aml_pred_assim.mapper import cds
 from aml_pred_assim.core import (
     get_climate_data_from_api,
     get_climate_data_from_file,
 )
+from tests import make_test_dir
 
 
 class TestClimateData(unittest.TestCase):
-    def setUp(self):
-        self.variables = ['temperature', 'humidity']
-        self.datetime_obj = datetime(2024, 10, 10, 6)
-        self.pressure_levels = ['1000', '850']
-        self.api_key = 'test_key'
-        self.file_path = 'test_data.nc'
+    @classmethod
+    def setUpClass(cls):
+        cls.variables = ['temperature', 'humidity']
+        cls.datetime_obj = datetime(2024, 10, 10, 6)
+        cls.pressure_levels = ['1000', '850']
+        cls.api_key = 'test_key'
+        cls.fields = np.random.default_rng(0).standard_normal((2, 4, 1, 3, 5, 6)).astype(np.float32)
+        cls.fields.flags.writeable = False
+        cls.test_dir = make_test_dir()
+        cls.file_path = os.path.join(cls.test_dir.name, 'test_data.nc')
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.test_dir.cleanup()
 
 
     def test_get_climate_data_from_api_invalid_inputs(self):
@@ -41,6 +55,73 @@ class TestClimateData(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             get_climate_data_from_file(self.variables, "nonexistent_file.nc")
 
+        with self.assertRaisesRegex(Exception, "not_a_variable"):
+            get_climate_data_from_file(["temperature", "not_a_variable"], __file__)
+
+
+    def _write_ensemble(self, fields):
+        with Dataset(self.file_path, "w", format="NETCDF4") as nc_file:
+            for name, size in zip(("number", "valid_time", "pressure_level", "latitude", "longitude"), fields.shape[1:]):
+                nc_file.createDimension(name, size)
+            for name, field in zip(("t", "r"), fields):
+                nc_file.createVariable(name, "f4", ("number", "valid_time", "pressure_level", "latitude", "longitude"))[:] = field
+        self.addCleanup(lambda: os.path.exists(self.file_path) and os.remove(self.file_path))
+
+
+    def test_get_climate_data_from_file(self):
+        self._write_ensemble(self.fields)
+        data = get_climate_data_from_file(["temperature", "relative_humidity"], self.file_path)
+
+        # Ensemble | Layer | Variable | Latitude | Longitude
+        self.assertEqual(data.shape, (4, 3, 2, 5, 6))
+        self.assertEqual(data.dtype, np.float32)
+        np.testing.assert_array_equal(data[1, 2, 0], self.fields[0, 1, 0, 2])
+        np.testing.assert_array_equal(data[3, 0, 1], self.fields[1, 3, 0, 0])
+
+
+    def test_get_climate_data_from_file_is_cached(self):
+        self._write_ensemble(self.fields)
+        first = get_climate_data_from_file(["temperature", "relative_humidity"], self.file_path)
+        second = get_climate_data_from_file(["temperature", "relative_humidity"], self.file_path)
+
+        self.assertTrue(np.shares_memory(first, second))
+        self.assertFalse(first.flags.writeable)
+
+        self._write_ensemble(self.fields + 1)
+        mtime_ns = os.stat(self.file_path).st_mtime_ns + 10**9
+        os.utime(self.file_path, ns=(mtime_ns, mtime_ns))
+        updated = get_climate_data_from_file(["temperature", "relative_humidity"], self.file_path)
+        np.testing.assert_array_equal(updated, first + 1)
+
+
+    def test_get_climate_data_from_api_cache_hit(self):
+        self._write_ensemble(self.fields)
+        with open(self.file_path, "rb") as f:
+            ensemble = f.read()
+
+        def download(target):
+            with open(target, "wb") as f:
+                f.write(ensemble)
+
+        cdsapi = mock.MagicMock()
+        cdsapi.Client.return_value.retrieve.return_value.download.side_effect = download
+        with make_test_dir() as cache_dir, mock.patch.dict("sys.modules", {"cdsapi": cdsapi}):
+            args = (["temperature", "relative_humidity"], self.datetime_obj, self.pressure_levels, self.api_key)
+            first = get_climate_data_from_api(*args, cache_dir=cache_dir)
+            second = get_climate_data_from_api(*args, cache_dir=cache_dir)
+            self.assertEqual(cdsapi.Client.call_count, 1)
+            cached = os.listdir(cache_dir)
+
+            # Other requests evict the least recently used ensemble beyond the limit
+            with mock.patch.object(cds, "_CACHE_MAX_ENTRIES", 1):
+                get_climate_data_from_api(*args[:2], ["300"], self.api_key, cache_dir=cache_dir)
+            self.assertEqual(cdsapi.Client.call_count, 2)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertNotEqual(os.listdir(cache_dir), cached)
+
+        np.testing.assert_array_equal(first, second)
+        np.testing.assert_array_equal(first[1, 2, 0], self.fields[0, 1, 0, 2])
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,121 @@
+from scipy.sparse import csr_matrix
+import numpy as np
+import unittest
+
+from aml_pred_assim.PrecisionMatrix import PrecisionMatrix
+
+
+class TestPrecisionMatrix(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(0)
+        cls.n = 6
+        cls.alpha = 0.5
+        cls.Xb = rng.standard_normal((20, cls.n)) + 10
+        cls.Xb.flags.writeable = False
+        cls.pred = [np.array([], dtype=int)] + [np.arange(i) for i in range(1, cls.n)]
+
+    def _reference(self):
+        T = np.eye(self.n)
+        D = np.zeros(self.n)
+        D[0] = 1 / np.var(self.Xb[:, 0])
+        for i in range(1, self.n):
+            p = self.pred[i]
+            X, y = self.Xb[:, p], self.Xb[:, i]
+            coef = np.linalg.solve(X.T @ X + self.alpha * np.eye(p.size), X.T @ y)
+            T[i, p] = -coef
+            D[i] = 1 / np.var(y - X @ coef)
+        return T, D
+
+    def test_decomposition_matches_ridge_regression(self):
+        T, D = PrecisionMatrix(self.Xb, self.pred, self.n, alpha=self.alpha, dtype=np.float64).get_decomposition_matrix()
+        T_ref, D_ref = self._reference()
+
+        np.testing.assert_allclose(T.toarray(), T_ref, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(D.toarray(), np.diag(D_ref), rtol=1e-8)
+
+    def test_empty_and_single_predecessors(self):
+        self.pred = [np.array([], dtype=int), np.array([0]), np.array([], dtype=int), np.array([1]),
+                     np.array([0, 2]), np.array([3])]
+        T, D = PrecisionMatrix(self.Xb, self.pred, self.n, alpha=self.alpha, dtype=np.float64).get_decomposition_matrix()
+        T_ref, D_ref = self._reference()
+
+        np.testing.assert_allclose(T.toarray(), T_ref, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(D.diagonal(), D_ref, rtol=1e-8)
+
+    def test_more_predecessors_than_samples(self):
+        rng = np.random.default_rng(2)
+        self.n = 30
+        self.Xb = rng.standard_normal((8, self.n)) + 10
+        self.pred = [np.array([], dtype=int)] + [np.arange(max(0, i - 12), i) for i in range(1, self.n)]
+        T_ref, D_ref = self._reference()
+
+        T, D = PrecisionMatrix(self.Xb, self.pred, self.n, alpha=self.alpha, dtype=np.float64).get_decomposition_matrix()
+        np.testing.assert_allclose(T.toarray(), T_ref, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(D.diagonal(), D_ref, rtol=1e-8)
+
+        T, D = PrecisionMatrix(self.Xb, self.pred, self.n, alpha=self.alpha).get_decomposition_matrix()
+        np.testing.assert_allclose(T.toarray(), T_ref, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(D.diagonal(), D_ref, rtol=1e-4)
+
+    def test_get_matrix(self):
+        precision_matrix = PrecisionMatrix(self.Xb, self.pred, self.n, alpha=self.alpha, dtype=np.float64)
+        T_ref, D_ref = self._reference()
+
+        self.assertIsInstance(precision_matrix.get_matrix(), csr_matrix)
+        np.testing.assert_allclose(precision_matrix.get_matrix().toarray(), T_ref.T @ T_ref + np.diag(D_ref), rtol=1e-8)
+
+    def test_single_precision(self):
+        T, D = PrecisionMatrix(self.Xb, self.pred, self.n, alpha=self.alpha).get_decomposition_matrix()
+        T_ref, D_ref = self._reference()
+
+        self.assertEqual(T.dtype, np.float32)
+        self.assertEqual(D.dtype, np.float32)
+        np.testing.assert_allclose(T.toarray(), T_ref, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(D.diagonal(), D_ref, rtol=1e-4)
+
+    def test_csr_predecessors(self):
+        indices = np.concatenate(self.pred)
+        indptr = np.cumsum([0] + [p.size for p in self.pred])
+
+        from_list = PrecisionMatrix(self.Xb, self.pred, self.n, alpha=self.alpha).get_matrix()
+        from_csr = PrecisionMatrix(self.Xb, (indices, indptr), self.n, alpha=self.alpha).get_matrix()
+
+        np.testing.assert_array_equal(from_list.toarray(), from_csr.toarray())
+
+    def test_threaded_fit_matches_serial_fit(self):
+        rng = np.random.default_rng(1)
+        n = 200
+        Xb = rng.standard_normal((15, n))
+        pred = [np.array([], dtype=int)] + [np.arange(max(0, i - 5), i) for i in range(1, n)]
+
+        serial = PrecisionMatrix(Xb, pred, n, n_jobs=1).get_matrix()
+        threaded = PrecisionMatrix(Xb, pred, n, n_jobs=4).get_matrix()
+
+        np.testing.assert_array_equal(serial.toarray(), threaded.toarray())
+
+    def test_invalid_inputs(self):
+        with self.assertRaises(ValueError):
+            PrecisionMatrix(self.Xb[0], self.pred, self.n)
+
+        with self.assertRaises(TypeError):
+            PrecisionMatrix(self.Xb, "pred", self.n)
+
+        with self.assertRaises(ValueError):
+            PrecisionMatrix(self.Xb, self.pred, self.n, alpha=0)
+
+        with self.assertRaises(ValueError):
+            PrecisionMatrix(self.Xb, self.pred[:-1], self.n)
+
+        with self.assertRaises(ValueError):
+            PrecisionMatrix(self.Xb, (np.arange(3), np.arange(3)), self.n)
+
+        with self.assertRaises(ValueError):
+            PrecisionMatrix(self.Xb, self.pred, self.n, n_jobs=0)
+
+        with self.assertRaises(ValueError):
+            PrecisionMatrix(self.Xb, self.pred, self.n, dtype=np.int32)
+
+
+if __name__ == '__main__':
+    unittest.main()
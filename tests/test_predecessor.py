@@ -0,0 +1,83 @@
+import numpy as np
+import unittest
+
+from aml_pred_assim.Predecessor import Predecessor
+
+
+class TestPredecessor(unittest.TestCase):
+    def setUp(self):
+        self.matrix = np.random.rand(2, 1, 3, 3)
+        self.predecessor = Predecessor(self.matrix)
+
+    def test_invalid_matrix(self):
+        with self.assertRaises(TypeError):
+            Predecessor([[1, 2], [3, 4]])
+
+        with self.assertRaises(ValueError):
+            Predecessor(np.random.rand(3, 3))
+
+    def test_get_point_predecessors(self):
+        predecessors = self.predecessor.get_point_predecessors((0, 0, 1, 1), 1)
+        np.testing.assert_array_equal(np.sort(predecessors), [0, 1, 2, 3])
+
+        predecessors = self.predecessor.get_point_predecessors((1, 0, 1, 1), 1)
+        np.testing.assert_array_equal(np.sort(predecessors), np.arange(13))
+
+    def test_get_point_predecessors_periodic(self):
+        predecessors = self.predecessor.get_point_predecessors((0, 0, 0, 0), 1, x_bound=False, y_bound=False)
+        np.testing.assert_array_equal(np.sort(predecessors), [2, 6, 7, 8])
+
+    def test_get_point_predecessors_periodic_wrap_to_higher_indices(self):
+        predecessor = Predecessor(np.zeros((2, 2, 4, 4)))
+        predecessors = predecessor.get_point_predecessors((0, 0, 0, 0), 1, x_bound=False, y_bound=False)
+        # The preceding coordinates of the first point wrap to the end of both axes
+        np.testing.assert_array_equal(predecessors, [15, 12, 13, 3])
+
+        indices, indptr = predecessor.get_all_predecessors_csr(1, x_bound=False, y_bound=False)
+        np.testing.assert_array_equal(indices[indptr[0]:indptr[1]], predecessors)
+
+    def test_get_point_predecessors_periodic_wide_radius(self):
+        for point in [(0, 0, 0, 0), (1, 0, 2, 1)]:
+            predecessors = self.predecessor.get_point_predecessors(point, 5, x_bound=False, y_bound=False)
+            own = point[0] * 9 + point[3] * 3 + point[2]
+            self.assertEqual(len(np.unique(predecessors)), len(predecessors))
+            self.assertNotIn(own, predecessors)
+
+    def test_get_point_predecessors_out_of_bounds(self):
+        self.assertEqual(len(self.predecessor.get_point_predecessors((2, 0, 0, 0), 1)), 0)
+
+    def test_get_point_predecessors_invalid_inputs(self):
+        with self.assertRaises(ValueError):
+            self.predecessor.get_point_predecessors((0, 0, 1), 1)
+
+        with self.assertRaises(ValueError):
+            self.predecessor.get_point_predecessors((0, 0, 1, 1), 0)
+
+        with self.assertRaises(TypeError):
+            self.predecessor.get_point_predecessors((0, 0, 1, 1), 1, x_bound=1)
+
+    def test_get_all_predecessors(self):
+        all_predecessors = self.predecessor.get_all_predecessors(1)
+
+        self.assertEqual(len(all_predecessors), self.matrix.size)
+        points = [(i, j, k, l) for i in range(2) for j in range(1) for l in range(3) for k in range(3)]
+        for point, predecessors in zip(points, all_predecessors):
+            expected = self.predecessor.get_point_predecessors(point, 1)
+            np.testing.assert_array_equal(np.sort(predecessors), np.sort(expected))
+
+    def test_get_all_predecessors_csr(self):
+        indices, indptr = self.predecessor.get_all_predecessors_csr(1)
+        all_predecessors = self.predecessor.get_all_predecessors(1)
+
+        self.assertEqual(indptr.size, self.matrix.size + 1)
+        self.assertEqual(indptr[-1], indices.size)
+        for point, predecessors in enumerate(all_predecessors):
+            np.testing.assert_array_equal(indices[indptr[point]:indptr[point + 1]], predecessors)
+
+    def test_get_all_predecessors_precede_their_point(self):
+        for index, predecessors in enumerate(self.predecessor.get_all_predecessors(2)):
+            self.assertTrue(np.all(predecessors < index))
+
+
+if __name__ == '__main__':
+    unittest.main()
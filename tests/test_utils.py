@@ -1,20 +1,31 @@
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, csr_matrix
+import netCDF4
 from netCDF4 import Dataset
 import numpy as np
 import unittest
 import os
 
-from aml_pred_assim.utils import save_matrix_to_netcdf, _save_dense_matrix_to_netcdf, _save_sparse_matrix_to_netcdf
+from aml_pred_assim import utils
+from aml_pred_assim.utils import save_matrix_to_netcdf, _save_dense_matrix_to_netcdf, _save_sparse_matrix_to_netcdf, \
+    _save_csr_matrix_to_netcdf
+from tests import make_test_dir
+
+
+def _eq(a, b):
+    """Assert that two small arrays are identical, shape and dtype included."""
+    a, b = np.ma.getdata(a), np.asarray(b)
+    assert a.shape == b.shape and a.dtype == b.dtype and a.tobytes() == b.tobytes(), f"{a!r} != {b!r}"
+
 
 class TestUtils(unittest.TestCase):
     def setUp(self):
         self.test_dense_matrix = np.array([[1, 2, 3], [4, 5, 6]])
         self.test_sparse_matrix = coo_matrix(([1, 2, 3], ([0, 1, 2], [1, 2, 0])), shape=(3, 3))
-        self.test_file_path = "test_matrix.nc"
+        self.test_dir = make_test_dir()
+        self.test_file_path = os.path.join(self.test_dir.name, "test_matrix.nc")
 
     def tearDown(self):
-        if os.path.exists(self.test_file_path):
-            os.remove(self.test_file_path)
+        self.test_dir.cleanup()
 
     def test_save_dense_matrix(self):
         save_matrix_to_netcdf(self.test_dense_matrix, self.test_file_path)
@@ -22,24 +33,61 @@ class TestUtils(unittest.TestCase):
         with Dataset(self.test_file_path, "r") as nc_file:
             self.assertTrue("data" in nc_file.variables)
             saved_matrix = nc_file.variables["data"][:]
-            np.testing.assert_array_equal(saved_matrix, self.test_dense_matrix)
+            _eq(saved_matrix, self.test_dense_matrix)
 
     def test_save_sparse_matrix(self):
         save_matrix_to_netcdf(self.test_sparse_matrix, self.test_file_path)
         
         with Dataset(self.test_file_path, "r") as nc_file:
-            self.assertTrue("data_row" in nc_file.variables)
-            self.assertTrue("data_col" in nc_file.variables)
-            self.assertTrue("data_data" in nc_file.variables)
+            self.assertTrue("data" in nc_file.variables)
             self.assertEqual(nc_file.sparse_format, "coo")
             
-            saved_rows = nc_file.variables["data_row"][:]
-            saved_cols = nc_file.variables["data_col"][:]
-            saved_data = nc_file.variables["data_data"][:]
+            saved = nc_file.variables["data"][:]
+            saved_rows, saved_cols, saved_data = saved["row"], saved["col"], saved["val"]
             
-            np.testing.assert_array_equal(saved_rows, self.test_sparse_matrix.row)
-            np.testing.assert_array_equal(saved_cols, self.test_sparse_matrix.col)
-            np.testing.assert_array_equal(saved_data, self.test_sparse_matrix.data)
+            _eq(saved_rows, self.test_sparse_matrix.row)
+            _eq(saved_cols, self.test_sparse_matrix.col)
+            _eq(saved_data, self.test_sparse_matrix.data)
+
+    def test_save_csr_matrix(self):
+        csr = self.test_sparse_matrix.tocsr()
+        save_matrix_to_netcdf(csr, self.test_file_path)
+
+        with Dataset(self.test_file_path, "r") as nc_file:
+            self.assertEqual(nc_file.sparse_format, "csr")
+            self.assertFalse("data" in nc_file.variables)
+
+            saved_indptr = nc_file.variables["data_indptr"][:]
+            saved_indices = nc_file.variables["data_indices"][:]
+            saved_data = nc_file.variables["data_data"][:]
+            shape = (nc_file.dimensions["dim_0"].size, nc_file.dimensions["dim_1"].size)
+
+            _eq(csr_matrix((saved_data, saved_indices, saved_indptr), shape=shape).toarray(), csr.toarray())
+
+    def test_save_dense_coo_matrix_as_csr(self):
+        coo = coo_matrix(np.arange(1, 13).reshape(2, 6))
+        save_matrix_to_netcdf(coo, self.test_file_path)
+
+        with Dataset(self.test_file_path, "r") as nc_file:
+            self.assertEqual(nc_file.sparse_format, "csr")
+            saved = csr_matrix((nc_file.variables["data_data"][:], nc_file.variables["data_indices"][:],
+                                nc_file.variables["data_indptr"][:]), shape=coo.shape)
+            _eq(saved.toarray(), coo.toarray())
+
+    def test_saved_variables_are_compressed(self):
+        save_matrix_to_netcdf(self.test_sparse_matrix, self.test_file_path)
+
+        with Dataset(self.test_file_path, "r") as nc_file:
+            filters = nc_file.variables["data"].filters()
+            self.assertTrue(filters["zlib"])
+            self.assertTrue(filters["shuffle"])
+            self.assertEqual(nc_file.variables["data"].chunking(), [self.test_sparse_matrix.nnz])
+
+        save_matrix_to_netcdf(self.test_dense_matrix, self.test_file_path, compress=False)
+
+        with Dataset(self.test_file_path, "r") as nc_file:
+            self.assertFalse(nc_file.variables["data"].filters()["zlib"])
+            _eq(nc_file.variables["data"][:], self.test_dense_matrix)
 
     def test_invalid_matrix_type(self):
         invalid_matrix = "not a matrix"
@@ -56,15 +104,45 @@ class TestUtils(unittest.TestCase):
             self.assertEqual(nc_file.dimensions["dim_0"].size, self.test_dense_matrix.shape[0])
             self.assertEqual(nc_file.dimensions["dim_1"].size, self.test_dense_matrix.shape[1])
             saved_matrix = nc_file.variables["test_dense"][:]
-            np.testing.assert_array_equal(saved_matrix, self.test_dense_matrix)
+            _eq(saved_matrix, self.test_dense_matrix)
+            # Small matrices are stored contiguously, without filters
+            self.assertEqual(nc_file.variables["test_dense"].chunking(), "contiguous")
+
+    def test__save_dense_matrix_to_netcdf_chunking(self):
+        large_matrix = np.arange(1024 * 4096, dtype=np.float64).reshape(1024, 4096)
+        with Dataset(self.test_file_path, "w", format="NETCDF4") as nc_file:
+            _save_dense_matrix_to_netcdf(large_matrix, nc_file, "test_dense")
+
+            var = nc_file.variables["test_dense"]
+            # 32 MiB is split along the leading dimension into two 16 MiB chunks
+            self.assertEqual(var.chunking(), [512, 4096])
+            self.assertTrue(var.filters()["zlib"])
+            self.assertTrue(var.filters()["shuffle"])
+            self.assertEqual(var.filters()["complevel"], 2)
+            np.testing.assert_array_equal(var[:], large_matrix)
+
+    def test_dense_matrix_compression_filters(self):
+        large_matrix = np.random.default_rng(0).standard_normal((512, 512))
+        for compression in ("zstd", "zlib"):
+            if compression == "zstd" and not netCDF4.__has_zstandard_support__:
+                continue
+            save_matrix_to_netcdf(large_matrix, self.test_file_path, compression=compression)
+
+            with Dataset(self.test_file_path, "r") as nc_file:
+                filters = nc_file.variables["data"].filters()
+                self.assertTrue(filters[compression])
+                self.assertEqual(filters["shuffle"], compression == "zlib")
+                np.testing.assert_array_equal(nc_file.variables["data"][:], large_matrix)
+
+    def test_compression_options_shuffle(self):
+        self.assertTrue(utils._compression_options((8,), True)["shuffle"])
+        self.assertNotIn("shuffle", utils._compression_options((8,), True, compression="zstd"))
 
     def test__save_sparse_matrix_to_netcdf(self):
         with Dataset(self.test_file_path, "w", format="NETCDF4") as nc_file:
             _save_sparse_matrix_to_netcdf(self.test_sparse_matrix, nc_file, "test_sparse")
             
-            self.assertTrue("test_sparse_row" in nc_file.variables)
-            self.assertTrue("test_sparse_col" in nc_file.variables)
-            self.assertTrue("test_sparse_data" in nc_file.variables)
+            self.assertTrue("test_sparse" in nc_file.variables)
             self.assertTrue("nnz" in nc_file.dimensions)
             self.assertTrue("dim_0" in nc_file.dimensions)
             self.assertTrue("dim_1" in nc_file.dimensions)
@@ -73,13 +151,29 @@ class TestUtils(unittest.TestCase):
             self.assertEqual(nc_file.dimensions["dim_1"].size, self.test_sparse_matrix.shape[1])
             self.assertEqual(nc_file.sparse_format, "coo")
             
-            saved_rows = nc_file.variables["test_sparse_row"][:]
-            saved_cols = nc_file.variables["test_sparse_col"][:]
-            saved_data = nc_file.variables["test_sparse_data"][:]
+            saved = nc_file.variables["test_sparse"][:]
+            saved_rows, saved_cols, saved_data = saved["row"], saved["col"], saved["val"]
             
-            np.testing.assert_array_equal(saved_rows, self.test_sparse_matrix.row)
-            np.testing.assert_array_equal(saved_cols, self.test_sparse_matrix.col)
-            np.testing.assert_array_equal(saved_data, self.test_sparse_matrix.data)
+            # Indices that fit are stored as int32, recording the original dtype
+            _eq(saved_rows, self.test_sparse_matrix.row.astype(np.int32))
+            _eq(saved_cols, self.test_sparse_matrix.col.astype(np.int32))
+            _eq(saved_data, self.test_sparse_matrix.data)
+            self.assertEqual(nc_file.variables["test_sparse"].row_dtype, str(self.test_sparse_matrix.row.dtype))
+            self.assertEqual(nc_file.variables["test_sparse"].col_dtype, str(self.test_sparse_matrix.col.dtype))
+
+    def test__save_csr_matrix_to_netcdf(self):
+        csr = self.test_sparse_matrix.tocsr()
+        with Dataset(self.test_file_path, "w", format="NETCDF4") as nc_file:
+            _save_csr_matrix_to_netcdf(csr, nc_file, "test_sparse")
+
+            self.assertEqual(nc_file.dimensions["nnz"].size, csr.nnz)
+            self.assertEqual(nc_file.dimensions["n_indptr"].size, csr.shape[0] + 1)
+            self.assertEqual(nc_file.sparse_format, "csr")
+
+            _eq(nc_file.variables["test_sparse_indptr"][:], csr.indptr.astype(np.int32))
+            self.assertEqual(nc_file.variables["test_sparse_indptr"].original_dtype, str(csr.indptr.dtype))
+            _eq(nc_file.variables["test_sparse_indices"][:], csr.indices)
+            _eq(nc_file.variables["test_sparse_data"][:], csr.data)
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()